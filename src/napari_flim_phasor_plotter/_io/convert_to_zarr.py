@@ -1,5 +1,7 @@
 from magicgui import magic_factory
+import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from napari.utils import notifications
 
 from magicgui.tqdm import tqdm
@@ -13,6 +15,35 @@ from magicgui.tqdm import tqdm
 #     widget.call_button.clicked.connect(toggle_cancel_button_visibility)
 
 
+def get_chunk_shape(stack_shape, dtype, target_chunk_size_in_MB=16):
+    """Get zarr chunk shape for a FLIM stack.
+
+    Each chunk holds a single channel, time point and z slice, the whole micro-time axis (for fft calculation
+    afterwards) and a square (y, x) tile. The tile side is the largest power of 2 (between 64 and 1024 pixels)
+    that keeps the chunk size below the target size.
+
+    Parameters
+    ----------
+    stack_shape : Tuple(int)
+        Stack shape with the following convention: (channel, ut, time, z, y, x).
+    dtype : numpy.dtype
+        Stack data type.
+    target_chunk_size_in_MB : float, optional
+        Target (uncompressed) chunk size in MB. The default is 16.
+
+    Returns
+    -------
+    chunks : Tuple(int)
+        Chunk shape (channel, ut, time, z, y, x).
+    """
+    import numpy as np
+    bytes_per_pixel = stack_shape[1] * np.dtype(dtype).itemsize
+    max_pixels_per_chunk = target_chunk_size_in_MB * 1e6 / bytes_per_pixel
+    tile_side = 2 ** int(np.floor(np.log2(np.sqrt(max_pixels_per_chunk))))
+    tile_side = int(np.clip(tile_side, 64, 1024))
+    return (1, stack_shape[1], 1, 1, min(tile_side, stack_shape[-2]), min(tile_side, stack_shape[-1]))
+
+
 @magic_factory(call_button='Convert', layout="vertical",
                folder_path={'widget_type': 'FileEdit',
                             'mode': 'd'},
@@ -33,12 +64,13 @@ name. The z slice and time point must be separated by an underscore.
         Path to the folder containing the FLIM images.
     """
     import zarr
-    import dask.array as da
+    from numcodecs import Blosc
     from pathlib import Path
     from natsort import natsorted
     from napari_flim_phasor_plotter._reader import get_read_function_from_extension, get_most_frequent_file_extension
     from napari_flim_phasor_plotter._reader import get_max_slice_shape_and_dtype, get_structured_list_of_paths
     from napari_flim_phasor_plotter._reader import get_max_zslices, get_max_time_points, ALLOWED_FILE_EXTENSION
+    from napari_flim_phasor_plotter._reader import _parse_tz_table
 
     folder_path = Path(folder_path)
     file_extension = get_most_frequent_file_extension(folder_path)
@@ -60,35 +92,57 @@ name. The z slice and time point must be separated by an underscore.
     # Get maximum shape and dtype from file names (file names must be in the format: "name_t000_z000")
     image_slice_shape, image_dtype = get_max_slice_shape_and_dtype(
         file_paths, file_extension)
+    # Parse time point and z slice from file names only once
+    tz_table = _parse_tz_table(file_paths, file_extension)
     # Get maximum time and z from file names
-    max_z = get_max_zslices(file_paths, file_extension)
-    max_time_point = get_max_time_points(file_paths, file_extension)
+    max_z = get_max_zslices(file_paths, file_extension, tz_table)
+    max_time_point = get_max_time_points(file_paths, file_extension, tz_table)
     # Build stack shape with the fllowing convention: (channel, ut, time, z, y, x)
     stack_shape = (
         *image_slice_shape[:-2], max_time_point, max_z, *image_slice_shape[-2:])
     # Get a nested list of time point containing a list of z slices
     list_of_time_point_paths = get_structured_list_of_paths(
-        file_paths, file_extension)
+        file_paths, file_extension, tz_table)
     # zarr file will be saved in the same folder as the input folder
     output_path = folder_path / (folder_path.stem + '.zarr')
-    # Using zarr to automatically guess chunk sizes
+    # Blosc with byte-shuffle groups the (mostly zero) high bytes of photon counts together for LZ4
+    compressor = Blosc(cname='lz4', clevel=5, shuffle=Blosc.SHUFFLE)
+    # One chunk per channel, (t, z) slice and (y, x) tile, with the micro-time axis in a single chunk
+    chunks = get_chunk_shape(stack_shape, image_dtype)
     # Create an empty zarr array of a specified shape and dtype filled with zeros
+    # (no synchronizer needed: chunks never span more than one (t, z) slice, so each chunk is written by a
+    # single thread)
     zarr_array = zarr.open(output_path, mode='w',
-                           shape=stack_shape, dtype=image_dtype)
-    # Using dask to rechunk micro-time axis in single chunk (for fft calculation afterwards)
-    dask_array = da.from_zarr(output_path)
-    # Rechunk axis 1 (micro-time axis) to a single chunk
-    dask_array = dask_array.rechunk(chunks={1: -1})
-    # Overwriting previous zarr rechunked
-    da.to_zarr(dask_array, output_path, overwrite=True)
-    # Read zarr as read/write
-    zarr_array = zarr.open(output_path, mode='r+')
-
-    # Fill zarr array with data
-    for z_paths, i in zip(tqdm(list_of_time_point_paths, label='time_points'), range(len(list_of_time_point_paths))):
-        for path, j in zip(tqdm(z_paths, label='z-slices'), range(len(z_paths))):
-            data, _ = imread(path)
-            zarr_array[:data.shape[0], :data.shape[1], i,
-                       j, :data.shape[2], :data.shape[3]] = data
+                           shape=stack_shape, dtype=image_dtype, chunks=chunks,
+                           compressor=compressor)
+
+    # Flatten nested list of paths into (time point index, z slice index, path)
+    slice_tasks = [(i, j, path)
+                   for i, z_paths in enumerate(list_of_time_point_paths)
+                   for j, path in enumerate(z_paths)]
+
+    def _fill_slice(i, j, path):
+        """Read a single file and write it to its (t, z) position in the zarr array."""
+        data, _ = imread(path)
+        zarr_array[:data.shape[0], :data.shape[1], i,
+                   j, :data.shape[2], :data.shape[3]] = data
+
+    # Fill zarr array with data (each (t, z) slice is read and written in a separate thread, with a single
+    # assignment per slice, so every chunk is compressed and stored exactly once)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [executor.submit(_fill_slice, i, j, path)
+                   for i, j, path in slice_tasks]
+        with tqdm(total=len(futures), label='slices') as progress_bar:
+            try:
+                for future in as_completed(futures):
+                    # Re-raise any exception from the worker thread
+                    future.result()
+                    progress_bar.update(1)
+            except BaseException:
+                # Do not read and write the remaining slices once one of them failed
+                # (executor.shutdown(cancel_futures=True) requires python >= 3.9)
+                for f in futures:
+                    f.cancel()
+                raise
 
     print('Done')
@@ -1,3 +1,5 @@
+import re
+from functools import lru_cache
 import numpy as np
 
 ALLOWED_FILE_EXTENSION = [
@@ -7,6 +9,10 @@ ALLOWED_FILE_EXTENSION = [
     '.zarr'
 ]
 
+# File name patterns of time point and z slice (like image_t000_z000.tif)
+_PATTERN_T = re.compile('_t(\\d+)')
+_PATTERN_Z = re.compile('_z(\\d+)')
+
 
 def napari_get_reader(path):
     """A basic implementation of a Reader contribution.
@@ -36,8 +42,8 @@ def read_single_ptu_file(path):
 
     ptu_file = PTUreader(path, print_header_data=False)
     data, _ = ptu_file.get_flim_data_stack()
-    # from (x, y, ch, ut) to (ch, ut, y, x)
-    data = np.moveaxis(data, [0, 1], [-2, -1])
+    # from (x, y, ch, ut) to (ch, ut, y, x), made C-contiguous so later writes walk memory sequentially
+    data = np.ascontiguousarray(np.moveaxis(data, [0, 1], [-2, -1]))
     # metadata per channel/detector
     metadata_per_channel = []
     metadata = ptu_file.head
@@ -52,9 +58,11 @@ def read_single_sdt_file(path):
     """Read a single sdt file."""
     import sdtfile
     sdt_file = sdtfile.SdtFile(path)  # header to be implemented
-    data_raw = np.asarray(sdt_file.data)  # option to choose channel to include
-    # from (ch, y, x, ut) to (ch, ut, y, x)
-    data = np.moveaxis(np.stack(data_raw), -1, 1)
+    # from (ch, y, x, ut) to (ch, ut, y, x), copying each channel block only once into a C-contiguous array
+    block_shape = sdt_file.data[0].shape
+    data = np.empty((len(sdt_file.data), block_shape[-1], *block_shape[:-1]), dtype=sdt_file.data[0].dtype)
+    for channel, data_block in enumerate(sdt_file.data):  # option to choose channel to include
+        data[channel] = np.moveaxis(data_block, -1, 0)
 
     metadata_per_channel = []
     for measure_info_recarray in sdt_file.measure_info:
@@ -87,6 +95,58 @@ get_read_function_from_extension = {
 }
 
 
+def get_ptu_slice_shape_and_dtype(path):
+    """Get (ch, ut, y, x) shape and dtype of a single ptu file without building the FLIM data stack."""
+    from napari_flim_phasor_plotter._io.readPTU_FLIM import PTUreader
+
+    ptu_file = PTUreader(path, print_header_data=False)
+    # same sizes get_flim_data_stack allocates, which depend on the raw records (not available from header only)
+    shape = (np.unique(ptu_file.channel).size, np.unique(ptu_file.tcspc).size,
+             ptu_file.head['ImgHdr_PixY'], ptu_file.head['ImgHdr_PixX'])
+    return shape, np.dtype(np.uint16)
+
+
+def get_sdt_slice_shape_and_dtype(path):
+    """Get (ch, ut, y, x) shape and dtype of a single sdt file without stacking its data blocks."""
+    import sdtfile
+    sdt_file = sdtfile.SdtFile(path)
+    # from (y, x, ut) of each channel block to (ch, ut, y, x)
+    block_shape = sdt_file.data[0].shape
+    shape = (len(sdt_file.data), block_shape[-1], *block_shape[:-1])
+    return shape, sdt_file.data[0].dtype
+
+
+def get_tif_slice_shape_and_dtype(path, channel_axis=0, ut_axis=1):
+    """Get (ch, ut, y, x) shape and dtype of a single tif file from its header, without decoding pixels."""
+    import tifffile
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        shape, dtype = series.shape, series.dtype
+    # same axes order as read_single_tif_file: ch and ut moved to 0 and 1 axes, other axes keep their order
+    other_axes = [axis for axis in range(len(shape)) if axis not in (channel_axis, ut_axis)]
+    shape = tuple(shape[axis] for axis in [channel_axis, ut_axis] + other_axes)
+    return shape, np.dtype(dtype)
+
+
+# Dictionary relating file extension to compatible shape and dtype probing function
+get_slice_shape_and_dtype_from_extension = {
+    '.tif': get_tif_slice_shape_and_dtype,
+    '.ptu': get_ptu_slice_shape_and_dtype,
+    '.sdt': get_sdt_slice_shape_and_dtype
+}
+
+
+@lru_cache(maxsize=16384)
+def _get_cached_slice_shape_and_dtype(get_slice_shape_and_dtype, file_path, modification_time, file_size):
+    """Probe slice shape and dtype only once per file version.
+
+    Probing ptu/sdt files means parsing them, so results are kept across calls (like reading a folder and then
+    converting it to zarr). File modification time and size are part of the cache key, so changed files are
+    probed again.
+    """
+    return get_slice_shape_and_dtype(file_path)
+
+
 def get_most_frequent_file_extension(path):
     """Get most frequent file extension in path.
 
@@ -100,6 +160,8 @@ def get_most_frequent_file_extension(path):
     most_frequent_file_type : str
         Most frequent file extension in path.
     """
+    import os
+    from collections import Counter
     from pathlib import Path
     # Check if path is a list of paths
     if isinstance(path, list):
@@ -116,26 +178,42 @@ def get_most_frequent_file_extension(path):
             if path.suffix != '':
                 # Get path suffix
                 suffixes = [path.suffix]
-            # Get suffixes from files inside
+            # Get suffixes from files inside (from entry names only, without building Path objects)
             else:
-                suffixes = [p.suffix for p in path.iterdir()]
+                with os.scandir(path) as entries:
+                    suffixes = [os.path.splitext(entry.name)[1] for entry in entries]
         # Get file suffix
         elif path.is_file():
             suffixes = [path.suffix]
     # Get most frequent file entension in path
-    most_frequent_file_type = max(set(suffixes), key=suffixes.count)
+    most_frequent_file_type = Counter(suffixes).most_common(1)[0][0]
     return most_frequent_file_type
 
 
 def recarray_to_dict(recarray):
-    # convert recarray to dict
-    dictionary = {}
-    for name in recarray.dtype.names:
-        if isinstance(recarray[name], np.recarray):
-            dictionary[name] = recarray_to_dict(recarray[name])
+    """Convert a (nested) numpy record or single record recarray to a dict."""
+    # convert all fields to python objects in a single call and name them with a per dtype cached extractor
+    return _get_record_extractor(recarray.dtype)(recarray.item())
+
+
+@lru_cache(maxsize=None)
+def _get_record_extractor(dtype):
+    """Get a function that maps a (nested) tuple of record values to a (nested) dict of field names."""
+    field_extractors = []
+    for name in dtype.names:
+        field_dtype = dtype.fields[name][0]
+        if field_dtype.names is not None:
+            field_extractors.append((name, _get_record_extractor(field_dtype)))
+        # sub-array fields come as numpy arrays, convert them to lists as well
+        elif field_dtype.shape:
+            field_extractors.append((name, np.ndarray.tolist))
         else:
-            dictionary[name] = recarray[name].item()
-    return dictionary
+            field_extractors.append((name, None))
+
+    def extract(values):
+        return {name: value if extractor is None else extractor(value)
+                for (name, extractor), value in zip(field_extractors, values)}
+    return extract
 
 
 def flim_file_reader(path):
@@ -201,7 +279,6 @@ def read_stack(folder_path):
     data, metadata_list : Tuple(array, List(dict))
         Array containing the FLIM images and a metadata list (one metadata per channel).
     """
-    import zarr
     import dask.array as da
     from natsort import natsorted
     from napari.utils import notifications
@@ -209,20 +286,25 @@ def read_stack(folder_path):
     if file_extension == '.zarr':
         file_paths = folder_path
         # TO DO: read zarr metadata
-        data = zarr.open(file_paths, mode='r+')
-        data = da.from_zarr(data)
+        # Open read-only, with dask chunks made of whole zarr chunks
+        data = da.from_zarr(str(file_paths), chunks='auto')
         metadata_list = []
     else:
         # Get all file path with specified file extension
         file_paths = natsorted([file_path for file_path in folder_path.iterdir(
         ) if file_path.suffix == file_extension])
-        # Estimate stack sizes
-        # TO DO: estimate stack size from shape and dtype instead of file size (to handle compressed files)
-        stack_size_in_MB = get_stack_estimated_size(file_paths, file_extension)
+        # Estimate in-memory stack size from slice shape, dtype and number of time points and z slices
+        image_slice_shape, image_dtype = get_max_slice_shape_and_dtype(
+            file_paths, file_extension)
+        tz_table = _parse_tz_table(file_paths, file_extension)
+        max_z = get_max_zslices(file_paths, file_extension, tz_table)
+        max_time_point = get_max_time_points(file_paths, file_extension, tz_table)
+        stack_size_in_MB = np.prod(image_slice_shape) * max_time_point * max_z * \
+            np.dtype(image_dtype).itemsize / 1e6
         if stack_size_in_MB < 2e3:  # 2GB
             # read full stack
             data, metadata_list = make_full_numpy_stack(
-                file_paths, file_extension)
+                file_paths, file_extension, image_slice_shape, image_dtype, tz_table)
         else:
             notifications.show_error(
                 'Stack is larger than 2GB, please convert to .zarr')
@@ -238,7 +320,8 @@ def read_stack(folder_path):
 def get_max_slice_shape_and_dtype(file_paths, file_extension):
     """Get max slice shape and dtype.
 
-    Go through files to get max shape (number of photon bins may vary from image to image)
+    Go through files to get max shape (number of photon bins may vary from image to image).
+    Shapes are probed from file headers/raw records whenever possible, without building the image arrays.
 
     Parameters
     ----------
@@ -252,18 +335,20 @@ def get_max_slice_shape_and_dtype(file_paths, file_extension):
     max_shape, data_type : Tuple(Tuple(int), numpy.dtype)
         Max shape and data type.
     """
-    # TO DO: offer fast reading option by calculating max shape from metadata (array may become bigger)
+    get_slice_shape_and_dtype = get_slice_shape_and_dtype_from_extension[file_extension]
     shapes_list = []
     for file_path in file_paths:
         if file_path.suffix == file_extension:
-            imread = get_read_function_from_extension[file_extension]
-            image_slice, _ = imread(file_path)
-            shapes_list.append(image_slice.shape)  # (ch, ut, y, x)
-    # Get slice max shape (ch, mt, y, x)
-    return max(shapes_list), image_slice.dtype
+            file_stat = file_path.stat()
+            image_slice_shape, image_slice_dtype = _get_cached_slice_shape_and_dtype(
+                get_slice_shape_and_dtype, file_path, file_stat.st_mtime_ns, file_stat.st_size)
+            shapes_list.append(image_slice_shape)  # (ch, ut, y, x)
+    # Get slice max shape (ch, mt, y, x) along each axis
+    max_shape = tuple(int(axis_size) for axis_size in np.max(shapes_list, axis=0))
+    return max_shape, image_slice_dtype
 
 
-def make_full_numpy_stack(file_paths, file_extension):
+def make_full_numpy_stack(file_paths, file_extension, image_slice_shape=None, image_dtype=None, tz_table=None):
     """Make full numpy stack from list of file paths.
 
     Parameters
@@ -272,34 +357,49 @@ def make_full_numpy_stack(file_paths, file_extension):
         A list of Path objects from pathlib.
     file_extension : str
         A file extension, like '.tif' or '.ptu'.
+    image_slice_shape : Tuple(int), optional
+        Max (ch, ut, y, x) slice shape, as returned by `get_max_slice_shape_and_dtype`. If None (default),
+        or if image_dtype is None, shape and dtype are probed from the files.
+    image_dtype : numpy.dtype, optional
+        Slice data type. If None (default), or if image_slice_shape is None, shape and dtype are probed
+        from the files.
+    tz_table : dict, optional
+        A dictionary relating each file path to its (current_t, current_z) tuple, as returned by
+        `_parse_tz_table`. If None (default), it is built from file_paths.
 
     Returns
     -------
     numpy_stack, metadata_per_channel : Tuple(numpy array, List(dict))
         A numpy array of shape (ch, ut, t, z, y, x) and a metadata list (one metadata per channel).
     """
-    # Read all images to get max slice shape
-    image_slice_shape, image_dtype = get_max_slice_shape_and_dtype(
-        file_paths, file_extension)
+    import os
+    import dask
+    if image_slice_shape is None or image_dtype is None:
+        # Probe all images to get max slice shape and dtype
+        image_slice_shape, image_dtype = get_max_slice_shape_and_dtype(
+            file_paths, file_extension)
     imread = get_read_function_from_extension[file_extension]
 
     list_of_time_point_paths = get_structured_list_of_paths(
-        file_paths, file_extension)
-    z_list, t_list = [], []
-    for list_of_zslice_paths in list_of_time_point_paths:
-        for zslice_path in list_of_zslice_paths:
-            data, metadata_per_channel = imread(zslice_path)
-            z_slice = np.zeros(image_slice_shape, dtype=image_dtype)
-            z_slice[:data.shape[0], :data.shape[1],
-                    :data.shape[2], :data.shape[3]] = data
-            z_list.append(z_slice)
-        z_stack = np.stack(z_list)
-        t_list.append(z_stack)
-        z_list = []
-    stack = np.stack(t_list)
-    # from (t, z, ch, ut, y, x) to (ch, ut, t, z, y, x)
-    stack = np.moveaxis(stack, [-4, -3], [0, 1])
-    return stack, metadata_per_channel
+        file_paths, file_extension, tz_table)
+    max_z = max(len(list_of_zslice_paths) for list_of_zslice_paths in list_of_time_point_paths)
+    # Allocate full stack only once, already with the (ch, ut, t, z, y, x) layout
+    stack = np.zeros((*image_slice_shape[:2], len(list_of_time_point_paths), max_z, *image_slice_shape[2:]),
+                     dtype=image_dtype)
+
+    def read_zslice(i, j, zslice_path):
+        """Read a single file and write it directly to its (t, z) position in the stack."""
+        data, metadata_per_channel = imread(zslice_path)
+        stack[:data.shape[0], :data.shape[1], i,
+              j, :data.shape[2], :data.shape[3]] = data
+        return metadata_per_channel
+
+    delayed_reads = [dask.delayed(read_zslice)(i, j, zslice_path)
+                     for i, list_of_zslice_paths in enumerate(list_of_time_point_paths)
+                     for j, zslice_path in enumerate(list_of_zslice_paths)]
+    # Read files in parallel threads (metadata from last file is kept, as for a sequential read)
+    metadata_list = dask.compute(*delayed_reads, scheduler='threads', num_workers=os.cpu_count())
+    return stack, metadata_list[-1]
 
 
 def get_current_tz(file_path):
@@ -315,22 +415,19 @@ def get_current_tz(file_path):
     current_t, current_z : Tuple(int, int)
         Current time point and z slice.
     """
-    import re
-    pattern_t = '_t(\\d+)'
-    pattern_z = '_z(\\d+)'
     current_t, current_z = None, None
     file_name = file_path.stem
-    matches_z = re.search(pattern_z, file_name)
+    matches_z = _PATTERN_Z.search(file_name)
     if matches_z is not None:
         current_z = int(matches_z.group(1))  # .zfill(2)
-    matches_t = re.search(pattern_t, file_name)
+    matches_t = _PATTERN_T.search(file_name)
     if matches_t is not None:
         current_t = int(matches_t.group(1))
     return current_t, current_z
 
 
-def get_max_zslices(file_paths, file_extension):
-    """Get max z slices.
+def _parse_tz_table(file_paths, file_extension):
+    """Get time point and z slice of every file with the given extension in a single pass over file names.
 
     Parameters
     ----------
@@ -341,18 +438,15 @@ def get_max_zslices(file_paths, file_extension):
 
     Returns
     -------
-    max_z : int
-        Max z slices.
+    tz_table : dict
+        A dictionary relating each file path to its (current_t, current_z) tuple.
     """
-    max_z = max([get_current_tz(file_path)
-                for file_path in file_paths if file_path.suffix == file_extension])[1]
-    if max_z is None:
-        return 1
-    return max_z
+    return {file_path: get_current_tz(file_path)
+            for file_path in file_paths if file_path.suffix == file_extension}
 
 
-def get_max_time_points(file_paths, file_extension):
-    """Get max time points.
+def get_max_zslices(file_paths, file_extension, tz_table=None):
+    """Get max z slices.
 
     Parameters
     ----------
@@ -360,21 +454,25 @@ def get_max_time_points(file_paths, file_extension):
         A list of Path objects from pathlib.
     file_extension : str
         A file extension, like '.tif' or '.ptu'.
+    tz_table : dict, optional
+        A dictionary relating each file path to its (current_t, current_z) tuple, as returned by
+        `_parse_tz_table`. If None (default), it is built from file_paths.
 
     Returns
     -------
-    max_time : int
-        Max time points.
+    max_z : int
+        Max z slices.
     """
-    max_time = max([get_current_tz(file_path)
-                   for file_path in file_paths if file_path.suffix == file_extension])[0]
-    if max_time is None:
+    if tz_table is None:
+        tz_table = _parse_tz_table(file_paths, file_extension)
+    max_z = max(tz_table.values())[1]
+    if max_z is None:
         return 1
-    return max_time
+    return max_z
 
 
-def get_stack_estimated_size(file_paths, file_extension, from_file_size=False):
-    """Get stack estimated size.
+def get_max_time_points(file_paths, file_extension, tz_table=None):
+    """Get max time points.
 
     Parameters
     ----------
@@ -382,29 +480,24 @@ def get_stack_estimated_size(file_paths, file_extension, from_file_size=False):
         A list of Path objects from pathlib.
     file_extension : str
         A file extension, like '.tif' or '.ptu'.
-    from_file_size : bool, optional
-        If True, the file size is used to estimate the stack size. If False, the stack size is estimated from the
-        image size (slower, but more accurate for compressed files). The default is False.
+    tz_table : dict, optional
+        A dictionary relating each file path to its (current_t, current_z) tuple, as returned by
+        `_parse_tz_table`. If None (default), it is built from file_paths.
 
     Returns
     -------
-    stack_size : float
-        Stack size in MB.
+    max_time : int
+        Max time points.
     """
-    stack_size = 0
-    for file_path in file_paths:
-        if file_path.suffix == file_extension:
-            if from_file_size:
-                file_size = file_path.stat().st_size / 1e6  # in MB
-            else:
-                imread = get_read_function_from_extension[file_extension]
-                data, metadata_list = imread(file_path)  # (ch, ut, y, x)
-                file_size = data.nbytes / 1e6  # in MB
-            stack_size += file_size
-    return stack_size
+    if tz_table is None:
+        tz_table = _parse_tz_table(file_paths, file_extension)
+    max_time = max(tz_table.values())[0]
+    if max_time is None:
+        return 1
+    return max_time
 
 
-def get_structured_list_of_paths(file_paths, file_extension):
+def get_structured_list_of_paths(file_paths, file_extension, tz_table=None):
     """Get structured list of paths.
 
     Parameters
@@ -413,6 +506,9 @@ def get_structured_list_of_paths(file_paths, file_extension):
         A list of Path objects from pathlib.
     file_extension : str
         A file extension, like '.tif' or '.ptu'.
+    tz_table : dict, optional
+        A dictionary relating each file path to its (current_t, current_z) tuple, as returned by
+        `_parse_tz_table`. If None (default), it is built from file_paths.
 
     Returns
     -------
@@ -420,13 +516,15 @@ def get_structured_list_of_paths(file_paths, file_extension):
         A list of lists of Path objects from pathlib. The first list is the time points, the second list is the z slices.
     """
     from natsort import natsorted
+    if tz_table is None:
+        tz_table = _parse_tz_table(file_paths, file_extension)
     t_path_list = []
     z_path_list = []
     file_paths = natsorted(file_paths)
     previous_t = 1
     for file_path in file_paths:
         if file_path.suffix == file_extension:
-            current_t, current_z = get_current_tz(file_path)
+            current_t, current_z = tz_table[file_path]
             if current_t is not None:
                 if current_t > previous_t:
                     t_path_list.append(z_path_list)
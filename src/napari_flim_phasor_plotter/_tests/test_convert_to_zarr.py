@@ -0,0 +1,13 @@
+from napari_flim_phasor_plotter._io.convert_to_zarr import get_chunk_shape
+import numpy as np
+
+
+def test_get_chunk_shape():
+    # 256 bins of uint16: 128 x 128 tiles keep chunks below 16 MB
+    assert get_chunk_shape((1, 256, 2, 3, 512, 512), np.uint16) == (1, 256, 1, 1, 128, 128)
+    # 4096 bins of uint16: tile side is clipped to the 64 pixels minimum
+    assert get_chunk_shape((2, 4096, 1, 1, 512, 512), np.uint16) == (1, 4096, 1, 1, 64, 64)
+    # a single uint8 bin: tile side is clipped to the 1024 pixels maximum
+    assert get_chunk_shape((1, 1, 1, 1, 2048, 2048), np.uint8) == (1, 1, 1, 1, 1024, 1024)
+    # frames smaller than the tile are kept in a single (y, x) chunk
+    assert get_chunk_shape((1, 256, 1, 1, 100, 50), np.uint16) == (1, 256, 1, 1, 100, 50)
@@ -0,0 +1,19 @@
+from napari_flim_phasor_plotter.filters import apply_median_filter
+import dask
+import dask.array as da
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('n', [1, 2])
+def test_apply_median_filter_dask(n):
+    rng = np.random.default_rng(0)
+    image = rng.poisson(5, size=(4, 2, 3, 16, 16)).astype(np.uint16)  # (ut, time, z, y, x)
+    expected = apply_median_filter(image, n)
+
+    # Small chunk size so that the spatial rechunk splits (y, x) into overlapping tiles
+    with dask.config.set({'array.chunk-size': '1KiB'}):
+        result = apply_median_filter(da.from_array(image, chunks=(4, 1, 3, 8, 8)), n)
+    assert isinstance(result, da.Array)
+    assert result.numblocks[3] * result.numblocks[4] > 1
+    assert np.array_equal(result.compute(), expected)
@@ -0,0 +1,62 @@
+from napari_flim_phasor_plotter.phasor import get_phasor_components
+import dask.array as da
+import numpy as np
+
+
+def test_get_phasor_components():
+    rng = np.random.default_rng(0)
+    flim_data = rng.poisson(5, size=(255, 2, 1, 6, 5)).astype(np.uint16)  # (ut, time, z, y, x)
+    harmonic = 2
+
+    # Reference phasor components from the full Fourier transform
+    fft_data = np.fft.fft(flim_data, axis=0)
+    dc_expected = fft_data[0].real
+    g_expected = fft_data[harmonic].real / dc_expected
+    s_expected = -fft_data[harmonic].imag / dc_expected
+
+    g, s, dc = get_phasor_components(flim_data, harmonic=harmonic)
+    assert np.allclose(dc, dc_expected)
+    assert np.allclose(g, g_expected)
+    assert np.allclose(s, s_expected)
+
+    # dask arrays (with micro-time axis split in chunks) must give the same results
+    flim_data_dask = da.from_array(flim_data, chunks=(100, 1, 1, 3, 3))
+    g, s, dc = get_phasor_components(flim_data_dask, harmonic=harmonic)
+    assert isinstance(g, da.Array)
+    assert np.allclose(dc.compute(), dc_expected)
+    assert np.allclose(g.compute(), g_expected)
+    assert np.allclose(s.compute(), s_expected)
+
+
+def test_get_phasor_components_dask_multiple_workers():
+    import dask
+    rng = np.random.default_rng(0)
+    flim_data = rng.poisson(5, size=(64, 4, 2, 16, 16)).astype(np.uint16)  # (ut, time, z, y, x)
+    g_expected, s_expected, dc_expected = get_phasor_components(flim_data)
+
+    # Several blocks computed at the same time in different threads
+    flim_data_dask = da.from_array(flim_data, chunks=(64, 1, 1, 8, 8))
+    g, s, dc = get_phasor_components(flim_data_dask)
+    g, s, dc = dask.compute(g, s, dc, scheduler='threads', num_workers=8)
+    assert np.allclose(dc, dc_expected)
+    assert np.allclose(g, g_expected)
+    assert np.allclose(s, s_expected)
+
+
+def test_get_phasor_components_dask_is_lazy():
+    computed_blocks = []
+
+    def count_blocks(block):
+        computed_blocks.append(block.shape)
+        return block
+
+    rng = np.random.default_rng(0)
+    flim_data = rng.poisson(5, size=(64, 2, 1, 8, 8)).astype(np.uint16)  # (ut, time, z, y, x)
+    flim_data_dask = da.from_array(flim_data, chunks=(64, 1, 1, 4, 4)).map_blocks(
+        count_blocks, meta=np.array((), dtype=np.uint16))
+
+    g, s, dc = get_phasor_components(flim_data_dask)
+    # Nothing is read until the results are explicitly computed
+    assert computed_blocks == []
+    da.compute(g, s, dc)
+    assert len(computed_blocks) > 0
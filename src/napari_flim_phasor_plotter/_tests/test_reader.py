@@ -29,3 +29,13 @@ from napari_flim_phasor_plotter import napari_get_reader
 # def test_get_reader_pass():
 #     reader = napari_get_reader("fake.file")
 #     assert reader is None
+
+
+def test_recarray_to_dict():
+    from napari_flim_phasor_plotter._reader import recarray_to_dict
+    dtype = np.dtype([('a', 'i4'), ('b', [('c', 'f8'), ('d', 'S4', (2,))])])
+    recarray = np.rec.array(np.array([(1, (2.5, [b'x', b'y']))], dtype=dtype))
+    expected = {'a': 1, 'b': {'c': 2.5, 'd': [b'x', b'y']}}
+    # single record recarray and single record must give the same nested dict
+    assert recarray_to_dict(recarray) == expected
+    assert recarray_to_dict(recarray[0]) == expected
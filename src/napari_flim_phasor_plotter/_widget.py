@@ -51,7 +51,6 @@ def make_flim_phasor_plot(image_layer: "napari.layers.Image",
     import numpy as np
     import dask.array as da
     import pandas as pd
-    from skimage.segmentation import relabel_sequential
     from napari.layers import Labels
 
     from napari_flim_phasor_plotter.phasor import get_phasor_components
@@ -79,25 +78,34 @@ def make_flim_phasor_plot(image_layer: "napari.layers.Image",
 
     g, s, dc = get_phasor_components(image, harmonic=harmonic)
 
-    label_image = np.arange(np.prod(dc.shape)).reshape(dc.shape) + 1
-    label_image[~space_mask] = 0
-    label_image = relabel_sequential(label_image)[0]
-
-    g_flat_masked = np.ravel(g[space_mask])
-    s_flat_masked = np.ravel(s[space_mask])
-    if isinstance(g, da.Array):
-        g_flat_masked.compute_chunk_sizes()
-        s_flat_masked.compute_chunk_sizes()
+    if isinstance(dc, da.Array):
+        # Keep everything lazy: sequential labels are the running count of kept pixels (as from relabel_sequential)
+        label_image = da.where(space_mask, da.cumsum(space_mask.ravel(), dtype=np.int32).reshape(dc.shape), 0)
+        frame = da.broadcast_to(da.arange(dc.shape[0]).reshape((-1,) + (1,) * (dc.ndim - 1)), dc.shape)
+        # Compute all outputs together, so that the phasor graph (and median filter) is evaluated only once
+        label_image, g_flat_masked, s_flat_masked, frame_flat_masked = da.compute(
+            label_image, g[space_mask], s[space_mask], frame[space_mask])
+        # Kept pixels are labelled 1, 2, ... in flat order, so their labels are simply 1 to the max label
+        label_flat_masked = np.arange(1, label_image.max() + 1, dtype=np.int32)
+    else:
+        # Scan space mask only once and gather kept pixels by their flat indices
+        kept_indices = np.flatnonzero(space_mask)
+        # Kept pixels get sequential labels (1, 2, ...) in flat order, all others are background (0)
+        label_flat_masked = np.arange(1, kept_indices.size + 1, dtype=np.int32)
+        label_image = np.zeros(dc.size, dtype=np.int32)
+        label_image[kept_indices] = label_flat_masked
+        label_image = label_image.reshape(dc.shape)
+        g_flat_masked = g.ravel()[kept_indices]
+        s_flat_masked = s.ravel()[kept_indices]
+        # Build frame column (first axis index of each kept pixel)
+        frame_flat_masked = kept_indices // np.prod(dc.shape[1:])
 
     phasor_components = pd.DataFrame({
-        'label': np.ravel(label_image[space_mask]),
+        'label': label_flat_masked,
         'G': g_flat_masked,
         'S': s_flat_masked})
     table = phasor_components
-    # Build frame column
-    frame = np.arange(dc.shape[0])
-    frame = np.repeat(frame, np.prod(dc.shape[1:]))
-    table['frame'] = frame[space_mask.ravel()]
+    table['frame'] = frame_flat_masked
 
     # The layer has to be created here so the plotter can be filled properly
     # below. Overwrite layer if it already exists.
@@ -55,13 +55,23 @@ def make_space_mask_from_manual_threshold(image, threshold):
 
 
 def apply_median_filter(image, n=1):
-    import numpy as np
-    from skimage.filters import median
+    import dask.array as da
     from skimage.morphology import cube
     assert len(image.shape) == 5, "Image must have 5 dimensions, even if unitary (ut, time, z, y, x)"
     footprint = cube(3)
-    # TODO: make this work with dask, may need rechunking and using
-    # https://image.dask.org/en/latest/dask_image.ndfilters.html#dask_image.ndfilters.median_filter
+    if isinstance(image, da.Array):
+        # Median runs over (z, y, x) of each (ut, time) volume: rechunk to spatial blocks first (whole z,
+        # (y, x) tiles) and overlap tiles by n pixels, as n median iterations reach n pixels away
+        image = image.rechunk({0: 'auto', 1: 1, 2: -1, 3: 'auto', 4: 'auto'})
+        return image.map_overlap(_median_filter_volumes, depth={3: n, 4: n}, boundary='none',
+                                 dtype=image.dtype, footprint=footprint, n=n)
+    return _median_filter_volumes(image, footprint, n)
+
+
+def _median_filter_volumes(image, footprint, n):
+    """Apply median filter n times to each (z, y, x) volume of a (ut, time, z, y, x) image."""
+    import numpy as np
+    from skimage.filters import median
     image_filt = np.copy(image)
     for i in range(n):
         for ut in range(image.shape[0]):
@@ -44,38 +44,77 @@ def get_phasor_components(flim_data, harmonic=1):
     """
     import dask.array as da
     if isinstance(flim_data, da.Array):
-        fft_slice_function = fft_slice_4d_dask
+        dft_function = dft_components_4d_dask
     else:
-        fft_slice_function = fft_slice_4d
+        dft_function = dft_components_4d
 
-    dc, _ = fft_slice_function(flim_data, 0)
-    # change the zeros to the img average
-    dc = np.where(dc != 0, dc, int(np.mean(dc)))
+    # DC and harmonic Fourier components are computed directly (no full fft needed for a single harmonic)
+    dc, g, s = dft_function(flim_data, harmonic)
+    # change the zeros to the img average (truncated to integer, kept lazy for dask arrays)
+    dc = np.where(dc != 0, dc, np.mean(dc).astype(np.int64))
 
-    g, s = fft_slice_function(flim_data, harmonic)
     g /= dc
     s /= -dc
 
     return g, s, dc
 
 
-@nb.njit
-def jit_fft(a, axis=-1):
-    """Numba fft version with rocket-fft"""
-    return np.fft.fft(a, axis=axis)
-
-
-def fft_slice_4d(arr, slice_num):
-    """Slice of FFT over first axis of a numpy array"""
-    fft_arr = jit_fft(arr, axis=0)
-    # Return the specified slice of the FFT array
-    return fft_arr[slice_num, ...].real, fft_arr[slice_num, ...].imag
-
-
-def fft_slice_4d_dask(arr, slice_num):
-    """Slice of FFT over first axis of a dask array"""
-    import dask.array as da
-    # Dask fft along first axis
-    fft_arr = da.fft.fft(arr, axis=0)
-    # Return the specified slice of the FFT array
-    return fft_arr[slice_num, ...].real, fft_arr[slice_num, ...].imag
+@nb.njit(cache=True)
+def _harmonic_tables(n_ut, harmonic):
+    """Cosine and sine lookup tables of the harmonic over n_ut micro-time bins"""
+    angles = 2 * np.pi * harmonic * np.arange(n_ut) / n_ut
+    return np.cos(angles), np.sin(angles)
+
+
+@nb.njit(cache=True)
+def _pixel_dft_components(arr_2d, pixel, cos_table, sin_table, components):
+    """Write DC and harmonic (real and imaginary) Fourier components of a single pixel to components"""
+    dc_sum, real_sum, imag_sum = 0.0, 0.0, 0.0
+    for ut in range(arr_2d.shape[0]):
+        value = arr_2d[ut, pixel]
+        dc_sum += value
+        real_sum += value * cos_table[ut]
+        imag_sum -= value * sin_table[ut]
+    components[0, pixel] = dc_sum
+    components[1, pixel] = real_sum
+    components[2, pixel] = imag_sum
+
+
+@nb.njit(parallel=True, cache=True)
+def jit_dft_components(arr_2d, harmonic):
+    """DC and harmonic (real and imaginary) Fourier components over first axis of a (ut, pixels) array"""
+    n_ut, n_pixels = arr_2d.shape
+    cos_table, sin_table = _harmonic_tables(n_ut, harmonic)
+    components = np.empty((3, n_pixels))
+    for pixel in nb.prange(n_pixels):
+        _pixel_dft_components(arr_2d, pixel, cos_table, sin_table, components)
+    return components
+
+
+@nb.njit(cache=True)
+def jit_dft_components_serial(arr_2d, harmonic):
+    """Single-threaded version of jit_dft_components, safe to call from several threads at once"""
+    n_ut, n_pixels = arr_2d.shape
+    cos_table, sin_table = _harmonic_tables(n_ut, harmonic)
+    components = np.empty((3, n_pixels))
+    for pixel in range(n_pixels):
+        _pixel_dft_components(arr_2d, pixel, cos_table, sin_table, components)
+    return components
+
+
+def dft_components_4d(arr, harmonic, parallel=True):
+    """DC, harmonic real and harmonic imaginary Fourier components over first axis of a numpy array"""
+    jit_function = jit_dft_components if parallel else jit_dft_components_serial
+    components = jit_function(arr.reshape(arr.shape[0], -1), harmonic)
+    # Stack components along first axis with the remaining original dimensions
+    return components.reshape((3,) + arr.shape[1:])
+
+
+def dft_components_4d_dask(arr, harmonic):
+    """DC, harmonic real and harmonic imaginary Fourier components over first axis of a dask array"""
+    # First axis needs to be in a single chunk, each block is then processed independently
+    arr = arr.rechunk({0: -1})
+    # Blocks already run in parallel threads: use the serial kernel, as nested numba parallel regions started
+    # from several threads at once abort the process with the workqueue threading layer
+    return arr.map_blocks(dft_components_4d, harmonic, parallel=False,
+                          chunks=((3,),) + arr.chunks[1:], dtype=np.float64)